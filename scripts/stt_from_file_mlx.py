@@ -11,10 +11,12 @@
 # ///
 
 import argparse
+import inspect
 import json
 
 import mlx.core as mx
 import mlx.nn as nn
+import numpy as np
 import sentencepiece
 import sphn
 from huggingface_hub import hf_hub_download
@@ -28,8 +30,37 @@ if __name__ == "__main__":
     parser.add_argument(
         "--vad", action="store_true", help="Enable VAD (Voice Activity Detection)."
     )
+    parser.add_argument(
+        "--dtype",
+        default="float16",
+        choices=["float16", "bfloat16"],
+        help="Model dtype; float16 is faster on M1/M2 which lack native bf16 matmul.",
+    )
+    parser.add_argument(
+        "--quantize",
+        type=int,
+        choices=[4, 8],
+        help="Quantize the model weights to this many bits after loading.",
+    )
+    parser.add_argument(
+        "--q-mode",
+        default="affine",
+        choices=["affine", "mxfp4", "nvfp4", "mxfp8"],
+        help="Quantization mode; the fp modes require MLX >= 0.31.",
+    )
     args = parser.parse_args()
 
+    # Fail before the weight download: the pinned moshi_mlx pulls in an mlx
+    # that predates quantization modes, where the fp modes would only die
+    # with a TypeError after the full model load.
+    if args.q_mode != "affine" and (
+        "mode" not in inspect.signature(nn.quantize).parameters
+    ):
+        parser.error(
+            f"--q-mode {args.q_mode} requires mlx >= 0.31 "
+            f"(installed: {mx.__version__}), use the default affine mode"
+        )
+
     audio, _ = sphn.read(args.in_file, sample_rate=24000)
     if args.hf_repo is None:
         if args.vad:
@@ -46,7 +77,6 @@ if __name__ == "__main__":
 
     lm_config = models.LmConfig.from_config_dict(lm_config)
     model = models.Lm(lm_config)
-    model.set_dtype(mx.bfloat16)
     if moshi_weights.endswith(".q4.safetensors"):
         nn.quantize(model, bits=4, group_size=32)
     elif moshi_weights.endswith(".q8.safetensors"):
@@ -57,6 +87,23 @@ if __name__ == "__main__":
         model.load_pytorch_weights(moshi_weights, lm_config, strict=True)
     else:
         model.load_weights(moshi_weights, strict=True)
+    # Cast after loading: load_weights replaces every parameter with the
+    # checkpoint's arrays as-is, so a set_dtype before it would be a no-op.
+    model.set_dtype(mx.float16 if args.dtype == "float16" else mx.bfloat16)
+
+    if args.quantize is not None and not moshi_weights.endswith(
+        (".q4.safetensors", ".q8.safetensors")
+    ):
+        print(f"quantizing model to {args.quantize} bits ({args.q_mode})")
+        if args.q_mode == "affine":
+            group_size = 32 if args.quantize == 4 else 64
+            nn.quantize(model, bits=args.quantize, group_size=group_size)
+        else:
+            nn.quantize(model, bits=args.quantize, group_size=32, mode=args.q_mode)
+
+    # Weight loading is lazy; materialize the parameters now rather than paying
+    # the deserialization cost on the first gen.step.
+    mx.eval(model.parameters())
 
     print(f"loading the text tokenizer from {text_tokenizer}")
     text_tokenizer = sentencepiece.SentencePieceProcessor(text_tokenizer)  # type: ignore
@@ -64,6 +111,7 @@ if __name__ == "__main__":
     print(f"loading the audio tokenizer {mimi_weights}")
     audio_tokenizer = models.mimi.Mimi(models.mimi_202407(32))
     audio_tokenizer.load_pytorch_weights(str(mimi_weights), strict=True)
+    mx.eval(audio_tokenizer.parameters())
     print("warming up the model")
     model.warmup()
     gen = models.LmGen(
@@ -75,26 +123,71 @@ if __name__ == "__main__":
     )
 
     print(f"starting inference {audio.shape}")
-    audio = mx.concat([mx.array(audio), mx.zeros((1, 48000))], axis=-1)
+    # Pad with the trailing silence on the numpy side so a single array is
+    # handed to MLX, instead of materializing two device arrays and a concat.
+    audio = mx.array(np.pad(audio, ((0, 0), (0, 48000))))
+    # The whole waveform is known up front, so tokenize it with one batched
+    # encoder pass instead of paying an encode_step launch per 80ms block.
+    n_steps = audio.shape[-1] // 1920
+    all_audio_tokens = audio_tokenizer.encode(audio[:, None, : n_steps * 1920])
+    mx.eval(all_audio_tokens)
     last_print_was_vad = False
-    for start_idx in range(0, audio.shape[-1] // 1920 * 1920, 1920):
-        block = audio[:, None, start_idx : start_idx + 1920]
-        other_audio_tokens = audio_tokenizer.encode_step(block).transpose(0, 2, 1)
+
+    # Buffer decoded token ids and detokenize a handful at a time: one
+    # sentencepiece C++ call per batch instead of an id_to_piece round-trip
+    # per token.
+    pending_tokens = []
+
+    def flush_tokens():
+        if pending_tokens:
+            pieces = text_tokenizer.id_to_piece(pending_tokens)  # type: ignore
+            print("".join(pieces).replace("▁", " "), end="", flush=True)
+            pending_tokens.clear()
+
+    # MLX is lazy: reading the text token with .item() right after gen.step
+    # would force a full graph eval per 80ms block. Instead schedule the eval
+    # asynchronously and only read the token back one iteration later, so the
+    # readback overlaps the next decode step. The padding check also happens
+    # on device: padding (0/3) dominates, so the host usually reads back a
+    # single bool and only fetches the token id for real text. With --vad the
+    # pr_vad readback forces a sync every step anyway, so that path handles
+    # the token inline to keep text and turn markers in order.
+    pending = None
+    for step_idx in range(n_steps):
+        other_audio_tokens = all_audio_tokens[:, :, step_idx : step_idx + 1].transpose(
+            0, 2, 1
+        )
         if args.vad:
             text_token, vad_heads = gen.step_with_extra_heads(other_audio_tokens[0])
+            audio_tokens = gen.last_audio_tokens()
             if vad_heads:
                 pr_vad = vad_heads[2][0, 0, 0].item()
                 if pr_vad > 0.5 and not last_print_was_vad:
+                    flush_tokens()
                     print(" [end of turn detected]")
                     last_print_was_vad = True
+            token = text_token[0].item()
+            if token not in (0, 3):
+                pending_tokens.append(token)
+                if len(pending_tokens) >= 4:
+                    flush_tokens()
+                last_print_was_vad = False
         else:
             text_token = gen.step(other_audio_tokens[0])
-        text_token = text_token[0].item()
-        audio_tokens = gen.last_audio_tokens()
-        _text = None
-        if text_token not in (0, 3):
-            _text = text_tokenizer.id_to_piece(text_token)  # type: ignore
-            _text = _text.replace("▁", " ")
-            print(_text, end="", flush=True)
-            last_print_was_vad = False
+            audio_tokens = gen.last_audio_tokens()
+            is_text = mx.logical_and(text_token[0] != 0, text_token[0] != 3)
+            mx.async_eval(text_token, is_text)
+            pending, prev = (text_token, is_text), pending
+            if prev is None:
+                continue
+            prev_token, prev_is_text = prev
+            if prev_is_text.item():
+                pending_tokens.append(prev_token[0].item())
+                if len(pending_tokens) >= 4:
+                    flush_tokens()
+    if pending is not None:
+        prev_token, prev_is_text = pending
+        if prev_is_text.item():
+            pending_tokens.append(prev_token[0].item())
+    flush_tokens()
     print()
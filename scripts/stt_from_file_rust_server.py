@@ -4,6 +4,7 @@
 #     "msgpack",
 #     "numpy",
 #     "sphn",
+#     "uvloop",
 #     "websockets",
 # ]
 # ///
@@ -19,6 +20,13 @@ import websockets
 SAMPLE_RATE = 24000
 FRAME_SIZE = 1920  # Send data in chunks
 
+# Persistent packer: reuses its internal buffer instead of building a fresh
+# Packer per msgpack.packb call. Only ever used from the send task.
+PACKER = msgpack.Packer(use_single_float=True, use_bin_type=True)
+
+# One second of silence, packed once and reused for the prefix/suffix sends.
+SILENCE_MSG = PACKER.pack({"type": "Audio", "pcm": [0.0] * SAMPLE_RATE})
+
 
 def load_and_process_audio(file_path):
     """Load an MP3 file, resample to 24kHz, convert to mono, and extract PCM float32 data."""
@@ -57,41 +65,43 @@ async def send_messages(websocket, rtf: float):
     audio_data = load_and_process_audio(args.in_file)
 
     async def send_audio(audio: np.ndarray):
+        # The server expects the PCM as a list of floats; converting with
+        # ndarray.tolist() happens in C instead of one float() call per sample.
         await websocket.send(
-            msgpack.packb(
-                {"type": "Audio", "pcm": [float(x) for x in audio]},
-                use_single_float=True,
+            PACKER.pack(
+                {"type": "Audio", "pcm": np.asarray(audio, dtype=np.float32).tolist()}
             )
         )
 
     # Start with a second of silence.
     # This is needed for the 2.6B model for technical reasons.
-    await send_audio([0.0] * SAMPLE_RATE)
-
-    start_time = time.time()
-    for i in range(0, len(audio_data), FRAME_SIZE):
-        await send_audio(audio_data[i : i + FRAME_SIZE])
-
-        expected_send_time = start_time + (i + 1) / SAMPLE_RATE / rtf
-        current_time = time.time()
-        if current_time < expected_send_time:
-            await asyncio.sleep(expected_send_time - current_time)
-        else:
-            await asyncio.sleep(0.001)
+    await websocket.send(SILENCE_MSG)
+
+    # Merge a few frames per websocket message: fewer sends means less msgpack
+    # and event-loop overhead, while pacing still follows the requested RTF.
+    # Pacing is integer nanosecond math on the monotonic clock, so there is no
+    # float accumulation error and no sensitivity to wall-clock jumps.
+    send_block = FRAME_SIZE * 5
+    block_ns = int(send_block * 1_000_000_000 / (SAMPLE_RATE * rtf))
+    start_ns = time.monotonic_ns()
+    for n, i in enumerate(range(0, len(audio_data), send_block), start=1):
+        await send_audio(audio_data[i : i + send_block])
+
+        delay_ns = start_ns + n * block_ns - time.monotonic_ns()
+        if delay_ns > 0:
+            await asyncio.sleep(delay_ns / 1e9)
 
     for _ in range(5):
-        await send_audio([0.0] * SAMPLE_RATE)
+        await websocket.send(SILENCE_MSG)
 
     # Send a marker to indicate the end of the stream.
-    await websocket.send(
-        msgpack.packb({"type": "Marker", "id": 0}, use_single_float=True)
-    )
+    await websocket.send(PACKER.pack({"type": "Marker", "id": 0}))
 
     # We'll get back the marker once the corresponding audio has been transcribed,
     # accounting for the delay of the model. That's why we need to send some silence
     # after the marker, because the model will not return the marker immediately.
     for _ in range(35):
-        await send_audio([0.0] * SAMPLE_RATE)
+        await websocket.send(SILENCE_MSG)
 
 
 async def stream_audio(url: str, api_key: str, rtf: float):
@@ -124,6 +134,14 @@ if __name__ == "__main__":
     )
     args = parser.parse_args()
 
+    try:
+        # uvloop noticeably lowers the asyncio overhead on the websocket path.
+        import uvloop
+
+        uvloop.install()
+    except ImportError:
+        pass
+
     url = f"{args.url}/api/asr-streaming"
     transcript = asyncio.run(stream_audio(url, args.api_key, args.rtf))
 
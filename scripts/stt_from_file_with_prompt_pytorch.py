@@ -3,7 +3,6 @@
 import argparse
 import itertools
 import math
-from collections import deque
 
 import julius
 import moshi.models
@@ -15,32 +14,46 @@ import tqdm
 class PromptHook:
     def __init__(self, tokenizer, prefix, padding_tokens=(0, 3)):
         self.tokenizer = tokenizer
-        self.prefix_enforce = deque(self.tokenizer.encode(prefix))
+        self.prefix_tokens = list(self.tokenizer.encode(prefix))
+        self.idx = 0
         self.padding_tokens = padding_tokens
+        # Device-side buffers, created lazily on first use so they live on the
+        # same device as the logits: the full enforced prefix, and the allowed
+        # token indices (padding tokens plus the next prefix token in the last
+        # slot, updated as the cursor advances).
+        self._prefix = None
+        self._allowed = None
+
+    def _ensure_buffers(self, device):
+        if self._prefix is None:
+            self._prefix = torch.tensor(
+                self.prefix_tokens, dtype=torch.long, device=device
+            )
+            self._allowed = torch.tensor(
+                [*self.padding_tokens, 0], dtype=torch.long, device=device
+            )
 
     def on_token(self, token):
-        if not self.prefix_enforce:
+        if self.idx >= len(self.prefix_tokens):
             return
 
-        token = token.item()
-
-        if token in self.padding_tokens:
-            pass
-        elif token == self.prefix_enforce[0]:
-            self.prefix_enforce.popleft()
-        else:
-            assert False
+        self._ensure_buffers(token.device)
+        # on_logits only leaves the padding tokens and the next prefix token
+        # available, so a single device-side compare tells us whether the
+        # prefix advanced; no need to read the token id back to the host.
+        if bool((token == self._prefix[self.idx]).any()):
+            self.idx += 1
 
     def on_logits(self, logits):
-        if not self.prefix_enforce:
+        if self.idx >= len(self.prefix_tokens):
             return
 
-        mask = torch.zeros_like(logits, dtype=torch.bool)
-        for t in self.padding_tokens:
-            mask[..., t] = True
-        mask[..., self.prefix_enforce[0]] = True
+        self._ensure_buffers(logits.device)
+        self._allowed[-1] = self._prefix[self.idx]
 
-        logits[:] = torch.where(mask, logits, float("-inf"))
+        kept = logits[..., self._allowed].clone()
+        logits.fill_(float("-inf"))
+        logits[..., self._allowed] = kept
 
 
 def main(args):
@@ -71,6 +84,15 @@ def main(args):
     else:
         lm_gen = moshi.models.LMGen(lm, temp=0, temp_text=0.0)
 
+    # Compile the two per-step calls: at batch=1 the decode step is dominated
+    # by Python dispatch and small kernel launches, which reduce-overhead mode
+    # captures into CUDA graphs.
+    if hasattr(torch, "compile"):
+        lm_gen.step = torch.compile(lm_gen.step, mode="reduce-overhead")
+        mimi.encode = torch.compile(mimi.encode, dynamic=False)
+    else:
+        print("torch.compile unavailable (torch < 2.0), running eager")
+
     audio_silence_prefix_seconds = info.stt_config.get(
         "audio_silence_prefix_seconds", 1.0
     )
@@ -79,7 +101,10 @@ def main(args):
 
     def _load_and_process(path):
         audio, input_sample_rate = sphn.read(path)
-        audio = torch.from_numpy(audio).to(args.device).mean(axis=0, keepdim=True)
+        # Fold to mono on the host before the device copy, so only a single
+        # channel's worth of samples crosses the bus.
+        audio = audio.mean(axis=0, keepdims=True)
+        audio = torch.from_numpy(audio).to(args.device)
         audio = julius.resample_frac(audio, input_sample_rate, mimi.sample_rate)
         if audio.shape[-1] % mimi.frame_size != 0:
             to_pad = mimi.frame_size - audio.shape[-1] % mimi.frame_size
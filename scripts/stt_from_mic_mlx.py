@@ -11,11 +11,13 @@
 # ///
 
 import argparse
+import inspect
 import json
-import queue
+import threading
 
 import mlx.core as mx
 import mlx.nn as nn
+import numpy as np
 import rustymimi
 import sentencepiece
 import sounddevice as sd
@@ -29,8 +31,37 @@ if __name__ == "__main__":
     parser.add_argument(
         "--vad", action="store_true", help="Enable VAD (Voice Activity Detection)."
     )
+    parser.add_argument(
+        "--dtype",
+        default="float16",
+        choices=["float16", "bfloat16"],
+        help="Model dtype; float16 is faster on M1/M2 which lack native bf16 matmul.",
+    )
+    parser.add_argument(
+        "--quantize",
+        type=int,
+        choices=[4, 8],
+        help="Quantize the model weights to this many bits after loading.",
+    )
+    parser.add_argument(
+        "--q-mode",
+        default="affine",
+        choices=["affine", "mxfp4", "nvfp4", "mxfp8"],
+        help="Quantization mode; the fp modes require MLX >= 0.31.",
+    )
     args = parser.parse_args()
 
+    # Fail before the weight download: the pinned moshi_mlx pulls in an mlx
+    # that predates quantization modes, where the fp modes would only die
+    # with a TypeError after the full model load.
+    if args.q_mode != "affine" and (
+        "mode" not in inspect.signature(nn.quantize).parameters
+    ):
+        parser.error(
+            f"--q-mode {args.q_mode} requires mlx >= 0.31 "
+            f"(installed: {mx.__version__}), use the default affine mode"
+        )
+
     if args.hf_repo is None:
         if args.vad:
             args.hf_repo = "kyutai/stt-1b-en_fr-candle"
@@ -46,7 +77,6 @@ if __name__ == "__main__":
 
     lm_config = models.LmConfig.from_config_dict(lm_config)
     model = models.Lm(lm_config)
-    model.set_dtype(mx.bfloat16)
     if moshi_weights.endswith(".q4.safetensors"):
         nn.quantize(model, bits=4, group_size=32)
     elif moshi_weights.endswith(".q8.safetensors"):
@@ -57,6 +87,23 @@ if __name__ == "__main__":
         model.load_pytorch_weights(moshi_weights, lm_config, strict=True)
     else:
         model.load_weights(moshi_weights, strict=True)
+    # Cast after loading: load_weights replaces every parameter with the
+    # checkpoint's arrays as-is, so a set_dtype before it would be a no-op.
+    model.set_dtype(mx.float16 if args.dtype == "float16" else mx.bfloat16)
+
+    if args.quantize is not None and not moshi_weights.endswith(
+        (".q4.safetensors", ".q8.safetensors")
+    ):
+        print(f"quantizing model to {args.quantize} bits ({args.q_mode})")
+        if args.q_mode == "affine":
+            group_size = 32 if args.quantize == 4 else 64
+            nn.quantize(model, bits=args.quantize, group_size=group_size)
+        else:
+            nn.quantize(model, bits=args.quantize, group_size=32, mode=args.q_mode)
+
+    # Weight loading is lazy; materialize the parameters now rather than paying
+    # the deserialization cost on the first gen.step.
+    mx.eval(model.parameters())
 
     print(f"loading the text tokenizer from {tokenizer}")
     text_tokenizer = sentencepiece.SentencePieceProcessor(tokenizer)  # type: ignore
@@ -76,10 +123,38 @@ if __name__ == "__main__":
         check=False,
     )
 
-    block_queue = queue.Queue()
+    # Ring of pre-allocated blocks: the realtime audio callback must not
+    # allocate a fresh array or contend on queue.Queue's lock per 80ms block,
+    # so it just copies into the next slot and bumps the write index. Each
+    # slot already has the (1, 1, 1920) shape encode_step expects, so the
+    # decode loop passes it through without any reshape or copy.
+    RING_SIZE = 64
+    ring = np.zeros((RING_SIZE, 1, 1, 1920), dtype=np.float32)
+    write_idx = 0
+    read_idx = 0
+    data_ready = threading.Event()
 
     def audio_callback(indata, _frames, _time, _status):
-        block_queue.put(indata.copy())
+        global write_idx
+        if write_idx - read_idx >= RING_SIZE:
+            # The decode loop fell a whole ring (~5s) behind; drop this block
+            # and say so rather than silently overwrite unread audio.
+            print("\naudio ring overflow, dropping a block", flush=True)
+            return
+        ring[write_idx % RING_SIZE, 0, 0, :] = indata[:, 0]
+        write_idx += 1
+        data_ready.set()
+
+    # Buffer decoded token ids and detokenize a handful at a time: one
+    # sentencepiece C++ call per batch instead of an id_to_piece round-trip
+    # per token.
+    pending_tokens = []
+
+    def flush_tokens():
+        if pending_tokens:
+            pieces = text_tokenizer.id_to_piece(pending_tokens)  # type: ignore
+            print("".join(pieces).replace("▁", " "), end="", flush=True)
+            pending_tokens.clear()
 
     print("recording audio from microphone, speak to get your words transcribed")
     last_print_was_vad = False
@@ -91,9 +166,12 @@ if __name__ == "__main__":
         callback=audio_callback,
     ):
         while True:
-            block = block_queue.get()
-            block = block[None, :, 0]
-            other_audio_tokens = audio_tokenizer.encode_step(block[None, 0:1])
+            while read_idx == write_idx:
+                data_ready.clear()
+                data_ready.wait()
+            block = ring[read_idx % RING_SIZE]
+            read_idx += 1
+            other_audio_tokens = audio_tokenizer.encode_step(block)
             other_audio_tokens = mx.array(other_audio_tokens).transpose(0, 2, 1)[
                 :, :, :other_codebooks
             ]
@@ -102,15 +180,23 @@ if __name__ == "__main__":
                 if vad_heads:
                     pr_vad = vad_heads[2][0, 0, 0].item()
                     if pr_vad > 0.5 and not last_print_was_vad:
+                        flush_tokens()
                         print(" [end of turn detected]")
                         last_print_was_vad = True
             else:
                 text_token = gen.step(other_audio_tokens[0])
-            text_token = text_token[0].item()
             audio_tokens = gen.last_audio_tokens()
-            _text = None
-            if text_token not in (0, 3):
-                _text = text_tokenizer.id_to_piece(text_token)  # type: ignore
-                _text = _text.replace("▁", " ")
-                print(_text, end="", flush=True)
+            # Padding (0/3) dominates during silence; do the check on device
+            # so the host only reads back an id for real text tokens.
+            is_text = mx.logical_and(text_token[0] != 0, text_token[0] != 3)
+            mx.async_eval(text_token, is_text)
+            if is_text.item():
+                pending_tokens.append(text_token[0].item())
+                if len(pending_tokens) >= 4:
+                    flush_tokens()
                 last_print_was_vad = False
+            else:
+                # The mic loop never ends, so buffered tokens must not sit
+                # through silence: flush as soon as padding follows text.
+                # Batching then only kicks in during continuous speech.
+                flush_tokens()
@@ -0,0 +1,86 @@
+# Shared checkpoint loading for the MLX TTS scripts. Not an entry point.
+#
+# Both TTS front-ends load the exact same artifacts, so the loader lives in
+# one place and there is a single cold-start path to keep fast. No explicit
+# cross-process weight sharing is needed on top of this: safetensors loading
+# memory-maps the file, so the OS page cache keeps one physical copy of the
+# tensor bytes however many scripts have the model open at once.
+
+import json
+from dataclasses import dataclass
+
+import mlx.core as mx
+import sentencepiece
+from moshi_mlx import models
+from moshi_mlx.client_utils import make_log
+from moshi_mlx.utils.loaders import hf_get
+
+try:
+    # Optional: parses the model config a few times faster than the stdlib,
+    # shaving a little off cold start.
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def log(level: str, msg: str):
+    print(make_log(level, msg))
+
+
+@dataclass
+class LoadedTTS:
+    raw_config: dict
+    lm_config: models.LmConfig
+    model: models.Lm
+    text_tokenizer: sentencepiece.SentencePieceProcessor
+    audio_tokenizer: models.mimi.Mimi
+
+
+def load_tts_model(hf_repo: str, dtype: str = "float16") -> LoadedTTS:
+    """Fetch and load the LM, text tokenizer and Mimi for `hf_repo`.
+
+    Quantization is left to the caller: it has to run after the weights are
+    loaded and the right scheme depends on the front-end.
+    """
+    log("info", "retrieving checkpoints")
+
+    raw_config = hf_get("config.json", hf_repo)
+    with open(hf_get(raw_config), "rb") as fobj:
+        data = fobj.read()
+    raw_config = orjson.loads(data) if orjson is not None else json.loads(data)
+
+    mimi_weights = hf_get(raw_config["mimi_name"], hf_repo)
+    moshi_name = raw_config.get("moshi_name", "model.safetensors")
+    moshi_weights = hf_get(moshi_name, hf_repo)
+    tokenizer = hf_get(raw_config["tokenizer_name"], hf_repo)
+    lm_config = models.LmConfig.from_config_dict(raw_config)
+    # There is a bug in moshi_mlx <= 0.3.0 handling of the ring kv cache.
+    # The following line gets around it for now.
+    lm_config.transformer.max_seq_len = lm_config.transformer.context
+    model = models.Lm(lm_config)
+
+    log("info", f"loading model weights from {moshi_weights}")
+    model.load_pytorch_weights(str(moshi_weights), lm_config, strict=True)
+    # Cast after loading: load_pytorch_weights replaces every parameter with
+    # the checkpoint's arrays uncast, so a set_dtype before it would be a
+    # no-op and the model would keep the checkpoint dtype.
+    model.set_dtype(mx.float16 if dtype == "float16" else mx.bfloat16)
+
+    log("info", f"loading the text tokenizer from {tokenizer}")
+    text_tokenizer = sentencepiece.SentencePieceProcessor(str(tokenizer))  # type: ignore
+
+    log("info", f"loading the audio tokenizer {mimi_weights}")
+    generated_codebooks = lm_config.generated_codebooks
+    audio_tokenizer = models.mimi.Mimi(models.mimi_202407(generated_codebooks))
+    audio_tokenizer.load_pytorch_weights(str(mimi_weights), strict=True)
+    # Weight loading is lazy; materialize the audio tokenizer now rather than
+    # paying the deserialization cost on the first decode_step.
+    mx.eval(audio_tokenizer.parameters())
+
+    return LoadedTTS(
+        raw_config=raw_config,
+        lm_config=lm_config,
+        model=model,
+        text_tokenizer=text_tokenizer,
+        audio_tokenizer=audio_tokenizer,
+    )
@@ -9,7 +9,7 @@
 # ///
 
 import argparse
-import json
+import inspect
 import queue
 import sys
 import time
@@ -17,21 +17,14 @@ import time
 import mlx.core as mx
 import mlx.nn as nn
 import numpy as np
-import sentencepiece
 import sounddevice as sd
 import sphn
-from moshi_mlx import models
-from moshi_mlx.client_utils import make_log
 from moshi_mlx.models.tts import (
     DEFAULT_DSM_TTS_REPO,
     DEFAULT_DSM_TTS_VOICE_REPO,
     TTSModel,
 )
-from moshi_mlx.utils.loaders import hf_get
-
-
-def log(level: str, msg: str):
-    print(make_log(level, msg))
+from tts_common import load_tts_model, log
 
 
 def main():
@@ -61,50 +54,55 @@ def main():
         type=int,
         help="The quantization to be applied, e.g. 8 for 8 bits.",
     )
+    parser.add_argument(
+        "--q-mode",
+        default="affine",
+        choices=["affine", "mxfp4", "nvfp4", "mxfp8"],
+        help="Quantization mode; the fp modes require MLX >= 0.31.",
+    )
+    parser.add_argument(
+        "--dtype",
+        default="float16",
+        choices=["float16", "bfloat16"],
+        help="Model dtype; float16 is faster on M1/M2 which lack native bf16 matmul.",
+    )
     args = parser.parse_args()
 
-    mx.random.seed(299792458)
-
-    log("info", "retrieving checkpoints")
-
-    raw_config = hf_get("config.json", args.hf_repo)
-    with open(hf_get(raw_config), "r") as fobj:
-        raw_config = json.load(fobj)
+    # Fail before the weight download: the pinned moshi_mlx pulls in an mlx
+    # that predates quantization modes, where the fp modes would only die
+    # with a TypeError after the full model load.
+    if args.q_mode != "affine" and (
+        "mode" not in inspect.signature(nn.quantize).parameters
+    ):
+        parser.error(
+            f"--q-mode {args.q_mode} requires mlx >= 0.31 "
+            f"(installed: {mx.__version__}), use the default affine mode"
+        )
 
-    mimi_weights = hf_get(raw_config["mimi_name"], args.hf_repo)
-    moshi_name = raw_config.get("moshi_name", "model.safetensors")
-    moshi_weights = hf_get(moshi_name, args.hf_repo)
-    tokenizer = hf_get(raw_config["tokenizer_name"], args.hf_repo)
-    lm_config = models.LmConfig.from_config_dict(raw_config)
-    # There is a bug in moshi_mlx <= 0.3.0 handling of the ring kv cache.
-    # The following line gets around it for now.
-    lm_config.transformer.max_seq_len = lm_config.transformer.context
-    model = models.Lm(lm_config)
-    model.set_dtype(mx.bfloat16)
+    mx.random.seed(299792458)
 
-    log("info", f"loading model weights from {moshi_weights}")
-    model.load_pytorch_weights(str(moshi_weights), lm_config, strict=True)
+    loaded = load_tts_model(args.hf_repo, dtype=args.dtype)
+    raw_config = loaded.raw_config
+    model = loaded.model
 
     if args.quantize is not None:
-        log("info", f"quantizing model to {args.quantize} bits")
-        nn.quantize(model.depformer, bits=args.quantize)
+        log("info", f"quantizing model to {args.quantize} bits ({args.q_mode})")
+        q_kwargs: dict = {"bits": args.quantize}
+        if args.q_mode != "affine":
+            q_kwargs.update(group_size=32, mode=args.q_mode)
+        nn.quantize(model.depformer, **q_kwargs)
         for layer in model.transformer.layers:
-            nn.quantize(layer.self_attn, bits=args.quantize)
-            nn.quantize(layer.gating, bits=args.quantize)
-
-    log("info", f"loading the text tokenizer from {tokenizer}")
-    text_tokenizer = sentencepiece.SentencePieceProcessor(str(tokenizer))  # type: ignore
-
-    log("info", f"loading the audio tokenizer {mimi_weights}")
-    generated_codebooks = lm_config.generated_codebooks
-    audio_tokenizer = models.mimi.Mimi(models.mimi_202407(generated_codebooks))
-    audio_tokenizer.load_pytorch_weights(str(mimi_weights), strict=True)
+            nn.quantize(layer.self_attn, **q_kwargs)
+            nn.quantize(layer.gating, **q_kwargs)
+    # Weight loading is lazy; materialize the (possibly quantized) parameters
+    # now rather than paying the deserialization cost on the first step.
+    mx.eval(model.parameters())
 
     cfg_coef_conditioning = None
     tts_model = TTSModel(
         model,
-        audio_tokenizer,
-        text_tokenizer,
+        loaded.audio_tokenizer,
+        loaded.text_tokenizer,
         voice_repo=args.voice_repo,
         temp=0.6,
         cfg_coef=1,
@@ -151,7 +149,11 @@ def main():
         if (frame == -1).any():
             return
         _pcm = tts_model.mimi.decode_step(frame[:, :, None])
-        _pcm = np.array(mx.clip(_pcm[0, 0], -1, 1))
+        _pcm = mx.clip(_pcm[0, 0], -1, 1)
+        # Keep the frame lazy: schedule the eval and let the consumer pull the
+        # samples out, so the generation loop is not stalled by a GPU->CPU
+        # sync on every frame.
+        mx.async_eval(_pcm)
         wav_frames.put_nowait(_pcm)
         _frames_cnt += 1
         print(f"generated {_frames_cnt / 12.5:.2f}s", end="\r", flush=True)
@@ -178,7 +180,7 @@ def main():
         def audio_callback(outdata, _a, _b, _c):
             try:
                 pcm_data = wav_frames.get(block=False)
-                outdata[:, 0] = pcm_data
+                outdata[:, 0] = np.asarray(pcm_data)
             except queue.Empty:
                 outdata[:] = 0
 
@@ -196,14 +198,19 @@ def main():
                 time.sleep(1)
     else:
         run()
-        frames = []
+        # Every frame is a fixed 1920 samples, so size the output once and
+        # write each frame into its slice instead of paying the extra copy
+        # (and peak memory) of an np.concat over the whole generation.
+        wav = np.empty(wav_frames.qsize() * 1920, dtype=np.float32)
+        idx = 0
         while True:
             try:
-                frames.append(wav_frames.get_nowait())
+                frame = np.asarray(wav_frames.get_nowait())
             except queue.Empty:
                 break
-        wav = np.concat(frames, -1)
-        sphn.write_wav(args.out, wav, mimi.sample_rate)
+            wav[idx : idx + frame.shape[-1]] = frame
+            idx += frame.shape[-1]
+        sphn.write_wav(args.out, wav[:idx], mimi.sample_rate)
 
 
 if __name__ == "__main__":
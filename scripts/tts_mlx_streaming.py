@@ -10,21 +10,16 @@
 
 import argparse
 from dataclasses import dataclass
-import json
-import queue
 import sys
 import time
 
 import mlx.core as mx
 import mlx.nn as nn
 import numpy as np
-import sentencepiece
 import sounddevice as sd
 import sphn
 import typing as tp
-from moshi_mlx import models
 from moshi_mlx.models.generate import LmGen
-from moshi_mlx.client_utils import make_log
 from moshi_mlx.modules.conditioner import (
     ConditionAttributes,
     ConditionTensor,
@@ -38,7 +33,8 @@ from moshi_mlx.models.tts import (
     TTSModel,
     script_to_entries,
 )
-from moshi_mlx.utils.loaders import hf_get
+
+from tts_common import load_tts_model, log
 
 
 def prepare_script(model: TTSModel, script: str, first_turn: bool) -> list[Entry]:
@@ -106,13 +102,21 @@ class TTSGen:
                 if self.offset < delay + tts_model.delay_steps:
                     audio_tokens[q] = tts_model.machine.token_ids.zero
 
+        # The token state machine lives in moshi_mlx and works on Python entry
+        # objects, so it cannot be compiled out from here; bind the method
+        # once to at least keep the attribute lookups out of the per-step hook.
+        machine_process = tts_model.machine.process
+
         def _on_text_hook(text_tokens):
             tokens = text_tokens.tolist()
             out_tokens = []
             for token in tokens:
-                out_token, _ = tts_model.machine.process(self.offset, self.state, token)
+                out_token, _ = machine_process(self.offset, self.state, token)
                 out_tokens.append(out_token)
-            text_tokens[:] = mx.array(out_tokens, dtype=mx.int64)
+            # The state machine usually passes tokens through unchanged; only
+            # rebuild the device array when it actually rewrote something.
+            if out_tokens != tokens:
+                text_tokens[:] = mx.array(out_tokens, dtype=mx.int64)
 
         self.lm_gen = LmGen(
             tts_model.lm,
@@ -127,6 +131,20 @@ class TTSGen:
             # cfg_is_no_text=cfg_is_no_text,
         )
 
+        # The step input is a constant tensor of zero-tokens; build it once
+        # instead of allocating it again on every decoder step. LmGen is
+        # strictly batch-1 and the model tiles the batch internally when
+        # direct CFG is active, so the input stays (1, missing) either way.
+        missing = tts_model.lm.n_q - tts_model.lm.dep_q
+        self._input_tokens = mx.full(
+            (1, missing), tts_model.machine.token_ids.zero, dtype=mx.int64
+        )
+
+        # -1 marker tokens only show up while the delayed codebooks warm up;
+        # past this offset every frame is complete and the per-frame device
+        # check (a GPU->CPU sync) can be skipped.
+        self._warmup_steps = max(tts_model.lm.delays) + tts_model.delay_steps
+
     def process_last(self):
         while len(self.state.entries) > 0 or self.state.end_step is not None:
             self._step()
@@ -141,29 +159,21 @@ class TTSGen:
             self._step()
 
     def _step(self):
-        missing = self.tts_model.lm.n_q - self.tts_model.lm.dep_q
-        missing = self.tts_model.lm.n_q - self.tts_model.lm.dep_q
-        input_tokens = (
-            mx.ones((1, missing), dtype=mx.int64)
-            * self.tts_model.machine.token_ids.zero
-        )
         self.lm_gen.step(
-            input_tokens, ct=self.ct, cross_attention_src=self.cross_attention_src
+            self._input_tokens,
+            ct=self.ct,
+            cross_attention_src=self.cross_attention_src,
         )
         frame = self.lm_gen.last_audio_tokens()
         self.offset += 1
-        if frame is not None:
-            if self.on_frame is not None:
+        if frame is not None and self.on_frame is not None:
+            if self.offset > self._warmup_steps or not (frame == -1).any():
                 self.on_frame(frame)
 
     def append_entry(self, entry):
         self.state.entries.append(entry)
 
 
-def log(level: str, msg: str):
-    print(make_log(level, msg))
-
-
 def main():
     parser = argparse.ArgumentParser(
         description="Run Kyutai TTS using the MLX implementation"
@@ -190,50 +200,41 @@ def main():
         type=int,
         help="The quantization to be applied, e.g. 8 for 8 bits.",
     )
+    parser.add_argument(
+        "--dtype",
+        default="float16",
+        choices=["float16", "bfloat16"],
+        help="Model dtype; float16 is faster on M1/M2 which lack native bf16 matmul.",
+    )
     args = parser.parse_args()
 
     mx.random.seed(299792458)
 
-    log("info", "retrieving checkpoints")
-
-    raw_config = hf_get("config.json", args.hf_repo)
-    with open(hf_get(raw_config), "r") as fobj:
-        raw_config = json.load(fobj)
-
-    mimi_weights = hf_get(raw_config["mimi_name"], args.hf_repo)
-    moshi_name = raw_config.get("moshi_name", "model.safetensors")
-    moshi_weights = hf_get(moshi_name, args.hf_repo)
-    tokenizer = hf_get(raw_config["tokenizer_name"], args.hf_repo)
-    lm_config = models.LmConfig.from_config_dict(raw_config)
-    # There is a bug in moshi_mlx <= 0.3.0 handling of the ring kv cache.
-    # The following line gets around it for now.
-    lm_config.transformer.max_seq_len = lm_config.transformer.context
-    model = models.Lm(lm_config)
-    model.set_dtype(mx.bfloat16)
-
-    log("info", f"loading model weights from {moshi_weights}")
-    model.load_pytorch_weights(str(moshi_weights), lm_config, strict=True)
+    loaded = load_tts_model(args.hf_repo, dtype=args.dtype)
+    raw_config = loaded.raw_config
+    model = loaded.model
 
     if args.quantize is not None:
         log("info", f"quantizing model to {args.quantize} bits")
         nn.quantize(model.depformer, bits=args.quantize)
-        for layer in model.transformer.layers:
-            nn.quantize(layer.self_attn, bits=args.quantize)
-            nn.quantize(layer.gating, bits=args.quantize)
-
-    log("info", f"loading the text tokenizer from {tokenizer}")
-    text_tokenizer = sentencepiece.SentencePieceProcessor(str(tokenizer))  # type: ignore
-
-    log("info", f"loading the audio tokenizer {mimi_weights}")
-    generated_codebooks = lm_config.generated_codebooks
-    audio_tokenizer = models.mimi.Mimi(models.mimi_202407(generated_codebooks))
-    audio_tokenizer.load_pytorch_weights(str(mimi_weights), strict=True)
+        # Quantize every linear in the transformer blocks, not just the
+        # attention and gating projections: the decode loop is bound by
+        # weight reads, so any projection left in bf16 costs bandwidth every
+        # step. The predicate skips layers whose width does not divide the
+        # quantization group size.
+        nn.quantize(
+            model.transformer,
+            bits=args.quantize,
+            class_predicate=lambda _, m: (
+                isinstance(m, nn.Linear) and m.weight.shape[-1] % 64 == 0
+            ),
+        )
 
     cfg_coef_conditioning = None
     tts_model = TTSModel(
         model,
-        audio_tokenizer,
-        text_tokenizer,
+        loaded.audio_tokenizer,
+        loaded.text_tokenizer,
         voice_repo=args.voice_repo,
         temp=0.6,
         cfg_coef=1,
@@ -259,16 +260,14 @@ def main():
         tts_model.make_condition_attributes(voices, cfg_coef_conditioning)
     ]
 
-    wav_frames = queue.Queue()
-
-    def _on_frame(frame):
-        if (frame == -1).any():
-            return
+    def _decode_frame(frame, out):
+        # Decode one frame and write the clipped PCM straight into `out`:
+        # np.from_dlpack views the evaluated mx buffer without copying, so the
+        # only host write is the copy into the pre-allocated destination.
         _pcm = tts_model.mimi.decode_step(frame[:, :, None])
-        _pcm = np.array(mx.clip(_pcm[0, 0], -1, 1))
-        wav_frames.put_nowait(_pcm)
-
-    gen = TTSGen(tts_model, all_attributes, on_frame=_on_frame)
+        clipped = mx.clip(_pcm[0, 0], -1, 1)
+        mx.eval(clipped)
+        out[:] = np.from_dlpack(clipped)
 
     def run():
         log("info", "starting the inference loop")
@@ -282,14 +281,33 @@ def main():
         gen.process_last()
 
     if args.out == "-":
+        # SPSC ring of pre-allocated frames between the generation loop and
+        # the realtime audio callback: no per-frame allocation and no lock for
+        # the callback to stall on, just two indices (CPython int loads and
+        # stores are atomic, which is all a single producer/consumer needs).
+        RING_FRAMES = 256
+        ring = np.zeros((RING_FRAMES, 1920), dtype=np.float32)
+        widx = 0
+        ridx = 0
+
+        def _on_frame(frame):
+            nonlocal widx
+            # Back-pressure: don't overwrite audio the callback hasn't played.
+            while widx - ridx >= RING_FRAMES:
+                time.sleep(0.01)
+            _decode_frame(frame, ring[widx % RING_FRAMES])
+            widx += 1
 
         def audio_callback(outdata, _a, _b, _c):
-            try:
-                pcm_data = wav_frames.get(block=False)
-                outdata[:, 0] = pcm_data
-            except queue.Empty:
+            nonlocal ridx
+            if ridx < widx:
+                outdata[:, 0] = ring[ridx % RING_FRAMES]
+                ridx += 1
+            else:
                 outdata[:] = 0
 
+        gen = TTSGen(tts_model, all_attributes, on_frame=_on_frame)
+
         with sd.OutputStream(
             samplerate=mimi.sample_rate,
             blocksize=1920,
@@ -297,19 +315,39 @@ def main():
             callback=audio_callback,
         ):
             run()
-            while True:
-                if wav_frames.qsize() == 0:
-                    break
+            while ridx < widx:
                 time.sleep(1)
     else:
-        run()
         frames = []
-        while True:
-            try:
-                frames.append(wav_frames.get_nowait())
-            except queue.Empty:
-                break
-        wav = np.concat(frames, -1)
+        frame_buf = []
+
+        # Offline output has no realtime constraint, so decode Mimi frames in
+        # batches of 8: one decoder invocation per batch instead of one per
+        # 80ms frame. decode_step keeps its streaming state across calls, so
+        # the audio is identical to per-frame decoding.
+        def _flush_frames():
+            if not frame_buf:
+                return
+            _pcm = tts_model.mimi.decode_step(mx.stack(frame_buf, axis=-1))
+            frames.append(np.array(mx.clip(_pcm[0, 0], -1, 1)))
+            frame_buf.clear()
+
+        def _on_frame(frame):
+            frame_buf.append(frame)
+            if len(frame_buf) >= 8:
+                _flush_frames()
+
+        gen = TTSGen(tts_model, all_attributes, on_frame=_on_frame)
+
+        run()
+        _flush_frames()
+        # Copy the chunks into a pre-sized buffer: np.concat would build
+        # temporaries and double peak memory for long generations.
+        wav = np.empty(sum(f.shape[-1] for f in frames), dtype=np.float32)
+        idx = 0
+        for f in frames:
+            wav[idx : idx + f.shape[-1]] = f
+            idx += f.shape[-1]
         sphn.write_wav(args.out, wav, mimi.sample_rate)
 
 
@@ -89,8 +89,10 @@ def main():
         def _on_frame(frame):
             nonlocal _frames_cnt
             if (frame != -1).all():
-                pcm = tts_model.mimi.decode(frame[:, 1:, :]).cpu().numpy()
-                pcms.put_nowait(np.clip(pcm[0, 0], -1, 1))
+                # Clamp on device so one device-to-host copy moves the final
+                # samples, instead of transferring and then clipping in numpy.
+                pcm = tts_model.mimi.decode(frame[:, 1:, :])[0, 0].clamp_(-1, 1)
+                pcms.put_nowait(pcm.cpu().numpy())
                 _frames_cnt += 1
                 print(f"generated {_frames_cnt / 12.5:.2f}s", end="\r", flush=True)
 
@@ -132,8 +134,8 @@ def main():
         with tts_model.mimi.streaming(1), torch.no_grad():
             pcms = []
             for frame in result.frames[tts_model.delay_steps :]:
-                pcm = tts_model.mimi.decode(frame[:, 1:, :]).cpu().numpy()
-                pcms.append(np.clip(pcm[0, 0], -1, 1))
+                pcm = tts_model.mimi.decode(frame[:, 1:, :])[0, 0].clamp_(-1, 1)
+                pcms.append(pcm.cpu().numpy())
             pcm = np.concatenate(pcms, axis=-1)
         sphn.write_wav(args.out, pcm, tts_model.mimi.sample_rate)
 
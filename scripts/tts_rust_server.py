@@ -11,7 +11,9 @@
 # ///
 import argparse
 import asyncio
+import collections
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
 
 import msgpack
@@ -29,42 +31,56 @@ AUTH_TOKEN = "public_token"
 
 
 async def receive_messages(websocket: websockets.ClientConnection, output_queue):
+    # Decode on a small worker pool: unpacking a few thousand floats per
+    # message on the event loop can delay feeding the audio callback. PCM
+    # conversion itself is a single numpy pass, so this mostly keeps large
+    # decodes from blocking text/control handling under load.
+    loop = asyncio.get_running_loop()
+    decoder_pool = ThreadPoolExecutor(max_workers=2)
+
     with tqdm.tqdm(desc="Receiving audio", unit=" seconds generated") as pbar:
         accumulated_samples = 0
         last_seconds = 0
 
         async for message_bytes in websocket:
-            msg = msgpack.unpackb(message_bytes)
+            msg = await loop.run_in_executor(
+                decoder_pool, msgpack.unpackb, message_bytes
+            )
 
             if msg["type"] == "Audio":
-                pcm = np.array(msg["pcm"]).astype(np.float32)
+                pcm = msg["pcm"]
+                if isinstance(pcm, (bytes, bytearray)):
+                    # Raw f32 payload: view it zero-copy.
+                    pcm = np.frombuffer(pcm, dtype=np.float32)
+                else:
+                    # Float list: convert straight to float32 in one pass
+                    # instead of building a float64 array and astype-copying.
+                    pcm = np.array(pcm, dtype=np.float32)
                 await output_queue.put(pcm)
 
-                accumulated_samples += len(msg["pcm"])
+                accumulated_samples += len(pcm)
                 current_seconds = accumulated_samples // SAMPLE_RATE
                 if current_seconds > last_seconds:
                     pbar.update(current_seconds - last_seconds)
                     last_seconds = current_seconds
 
+    decoder_pool.shutdown(wait=False)
     print("End of audio.")
     await output_queue.put(None)  # Signal end of audio
 
 
 async def output_audio(out: str, output_queue: asyncio.Queue[np.ndarray | None]):
     if out == "-":
-        should_exit = False
+        # The audio callback runs on the PortAudio thread, where touching an
+        # asyncio.Queue is not thread-safe (and each get allocates a waiter).
+        # Shuttle the frames into a deque instead: append/popleft are atomic
+        # in CPython, which is all a single producer/consumer pair needs.
+        buf = collections.deque()
 
         def audio_callback(outdata, _a, _b, _c):
-            nonlocal should_exit
-
             try:
-                pcm_data = output_queue.get_nowait()
-                if pcm_data is not None:
-                    outdata[:, 0] = pcm_data
-                else:
-                    should_exit = True
-                    outdata[:] = 0
-            except asyncio.QueueEmpty:
+                outdata[:, 0] = buf.popleft()
+            except IndexError:
                 outdata[:] = 0
 
         with sd.OutputStream(
@@ -74,31 +90,61 @@ async def output_audio(out: str, output_queue: asyncio.Queue[np.ndarray | None])
             callback=audio_callback,
         ):
             while True:
-                if should_exit:
+                item = await output_queue.get()
+                if item is None:
                     break
-                await asyncio.sleep(1)
+                buf.append(item)
+            # Let the callback drain the remaining frames before teardown.
+            while buf:
+                await asyncio.sleep(0.1)
     else:
         frames = []
+        total = 0
         while True:
             item = await output_queue.get()
             if item is None:
                 break
             frames.append(item)
-
-        sphn.write_wav(out, np.concat(frames, -1), SAMPLE_RATE)
+            total += item.shape[-1]
+
+        # Copy the chunks into a pre-sized buffer: np.concat would build
+        # temporaries and double peak memory for long generations.
+        wav = np.empty(total, dtype=np.float32)
+        idx = 0
+        for frame in frames:
+            wav[idx : idx + frame.shape[-1]] = frame
+            idx += frame.shape[-1]
+        sphn.write_wav(out, wav, SAMPLE_RATE)
         print(f"Saved audio to {out}")
 
 
-async def read_lines_from_stdin():
+async def read_words_from_stdin():
+    """Yield words from stdin as soon as whitespace closes them.
+
+    Reading byte chunks instead of whole lines means the first words of a
+    sentence reach the server while the rest is still being typed, instead of
+    buffering until Enter is hit.
+    """
     reader = asyncio.StreamReader()
     protocol = asyncio.StreamReaderProtocol(reader)
     loop = asyncio.get_running_loop()
     await loop.connect_read_pipe(lambda: protocol, sys.stdin)
+    residual = b""
     while True:
-        line = await reader.readline()
-        if not line:
+        chunk = await reader.read(128)
+        if not chunk:
             break
-        yield line.decode().rstrip()
+        residual += chunk
+        words = residual.split()
+        if residual[-1:].isspace() or not words:
+            residual = b""
+        else:
+            # The trailing word may still be getting typed; hold it back.
+            residual = words.pop()
+        for word in words:
+            yield word.decode()
+    if residual:
+        yield residual.decode()
 
 
 async def read_lines_from_file(path: str):
@@ -121,8 +167,8 @@ async def read_lines_from_file(path: str):
 
 async def get_lines(source: str):
     if source == "-":
-        async for line in read_lines_from_stdin():
-            yield line
+        async for word in read_words_from_stdin():
+            yield word
     else:
         async for line in read_lines_from_file(source):
             yield line